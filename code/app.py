@@ -1,232 +1,270 @@
-﻿import eventlet
-eventlet.monkey_patch()  # eventlet 패치를 맨 위에 추가
-
+﻿import asyncio
 import base64
+import functools
 import main
+import fast_json
 import logging
-import signal
+import socket
 import sys
-import threading
-from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, Optional, Tuple, TypedDict, Union
 import os
 import socketio
-from flask import Flask, send_from_directory
+import uvicorn
+from uvicorn.protocols.http.auto import AutoHTTPProtocol
+from starlette.staticfiles import StaticFiles
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Define client roles
+# AI 파이프라인에서 동시에 처리 중일 수 있는 'image' 프레임 수. 초과분은 대기 슬롯 하나에 최신 프레임만 보관
+MAX_AI_IN_FLIGHT = 1
+
+# 이미지 페이로드 상한 (웹캠 JPEG 프레임은 보통 수십~수백 KB). 넘으면 역할 확인/로그 전에 바로 거부.
+# base64 환산 크기도 engine.io 기본 패킷 상한(1MB) 아래라서 연결을 끊지 않고 에러로 응답할 수 있음
+MAX_IMAGE_BYTES = 512 * 1024
+MAX_IMAGE_B64_BYTES = (MAX_IMAGE_BYTES + 2) // 3 * 4  # 'result' 이벤트의 base64 문자열 기준
+
+# Define client roles (interned: 저장된 역할은 항상 이 객체이므로 비교가 포인터 비교로 끝남)
 class ClientRole:
-    MONITOR = "monitor"
-    LAPA = "lapa"
+    MONITOR = sys.intern("monitor")
+    AI = sys.intern("ai")
+    LAPA = sys.intern("lapa")
+
+# 등록 가능한 역할. 클라이언트가 보낸 문자열 대신 ClientRole 상수를 저장하기 위한 조회 테이블
+REGISTRABLE_ROLES = {role: role for role in (ClientRole.MONITOR, ClientRole.AI, ClientRole.LAPA)}
 
-# Define message structures
-@dataclass
-class InputMessage:
-    image: str
+# 이벤트별 허용 역할 (모듈 로드 시 한 번만 생성)
+_MONITOR_ALLOWED = frozenset({ClientRole.MONITOR})  # image, result
+_CONTROL_ALLOWED = frozenset({ClientRole.MONITOR, 'admin', ClientRole.LAPA})  # filter, trigger_end
+_PEOPLE_ALLOWED = frozenset({ClientRole.LAPA})
+
+# Define message structures (Socket.IO로 주고받는 dict 페이로드의 형태)
+class InputMessage(TypedDict):
+    image: Union[bytes, str]  # 'image' 이벤트는 JPEG 바이너리, 'result' 이벤트는 base64 문자열
     filter_number: int
     people_count: int
 
-@dataclass
-class OutputMessage:
-    image: str
+class OutputMessage(TypedDict):
+    image: bytes
 
 # Define EndMessage structure for "end" event
-@dataclass
-class EndMessage:
+class EndMessage(TypedDict):
     end_frame: str
     end_img1: str
     end_img2: str
 
-@dataclass
-class CompositedEndMessage:
+class CompositedEndMessage(TypedDict):
     composited_image: str  # Assuming AI sends back a single composited image
 
 # Hub to manage clients and shared state
 class Hub:
+    """
+    All Hub state is read and written only from the event loop thread, and no
+    method awaits, so each call runs to completion without interleaving. Reads
+    (filter_number, people_count) are therefore plain attribute accesses and
+    writes need no lock. A reader-writer lock would only add overhead on the
+    per-frame reads; revisit only if Hub is ever touched from worker threads
+    (main.input never is).
+
+    Client roles are not kept here: each client's role lives in its Socket.IO
+    session and role -> clients in the room named after the role.
+    """
     def __init__(self):
-        self.clients: Dict[str, str] = {}  # role -> sid
         self.filter_number: int = 0
         self.people_count: int = 1
-        self.input_image_data: str = ""
-        self.output_image_data: str = ""
-        self.lock = threading.Lock()
-
-    def register_client(self, role: str, sid: str, sio: socketio.Server):
-        with self.lock:
-            if role in self.clients:
-                # Disconnect the old client
-                old_sid = self.clients[role]
-                sio.disconnect(old_sid)
-                logger.info(f"Existing client for role '{role}' disconnected: SID {old_sid}")
-            self.clients[role] = sid
-            logger.info(f"Client registered: Role '{role}', SID {sid}")
-
-    def unregister_client(self, sid: str):
-        with self.lock:
-            for role, client_sid in list(self.clients.items()):
-                if client_sid == sid:
-                    del self.clients[role]
-                    logger.info(f"Client disconnected: Role '{role}', SID {sid}")
-                    break
-
-    def get_client_sid(self, role: str) -> str:
-        with self.lock:
-            return self.clients.get(role, "")
+        self.pending_inputs: Dict[str, InputMessage] = {}  # 보낸 Monitor(SID)마다 가장 최근 프레임만 유지 (last-value conflation)
+        self.ai_in_flight: int = 0  # AI 파이프라인에서 처리 중인 프레임 수
 
     def set_filter_number(self, filter_number: int):
-        with self.lock:
-            self.filter_number = filter_number
-            logger.info(f"Filter number updated to: {filter_number}")
+        self.filter_number = filter_number
+        logger.info(f"Filter number updated to: {filter_number}")
 
     def set_people_count(self, people_count: int):
-        with self.lock:
-            self.people_count = people_count
-            logger.info(f"People count updated to: {people_count}")
+        self.people_count = people_count
+        logger.info(f"People count updated to: {people_count}")
+
+    def snapshot(self) -> Tuple[int, int]:
+        return self.filter_number, self.people_count
 
-    def set_input_image_data(self, image_data: str):
-        with self.lock:
-            self.input_image_data = image_data
-            logger.info("Input image data updated.")
+    def take_pending_input(self) -> Optional[Tuple[str, InputMessage]]:
+        # 가장 오래 기다린 Monitor의 프레임부터 꺼냄 (dict는 삽입 순서 유지)
+        for sid in self.pending_inputs:
+            return sid, self.pending_inputs.pop(sid)
+        return None
 
-    def set_output_image_data(self, image_data: str):
-        with self.lock:
-            self.output_image_data = image_data
-            logger.info("Output image data updated.")
+    def discard_pending_input(self, sid: str):
+        self.pending_inputs.pop(sid, None)
 
     def set_end_images(self, end_frame: str, end_img1: str, end_img2: str):
         # Optionally store end images if needed
         pass
 
-# Initialize Flask and Socket.IO
-app = Flask(__name__, static_folder='public')
-sio = socketio.Server(
-    async_mode='eventlet',
-    cors_allowed_origins='*'  # 모든 출처 허용 (보안 필요 시 특정 도메인으로 제한)
+# Initialize Socket.IO (asyncio 이벤트 루프 위에서 ASGI 앱으로 동작)
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins='*',  # 모든 출처 허용 (보안 필요 시 특정 도메인으로 제한)
+    json=fast_json  # stdlib json 대신 orjson으로 페이로드 직렬화
 )
-app.wsgi_app = socketio.WSGIApp(sio, app.wsgi_app)
 
 # Initialize Hub
 hub = Hub()
 
+def requires_role(allowed: frozenset):
+    """
+    Lets the event through only when the sender registered with one of the
+    allowed roles. The wrapped handler receives the sender role as a third argument.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)  # sio.event은 함수 이름으로 이벤트를 등록
+        async def wrapper(sid, data):
+            try:
+                role = (await sio.get_session(sid)).get('role', '')
+            except KeyError:
+                # 이벤트 처리 중 연결이 끊겨 세션이 사라진 경우: 미등록 클라이언트로 취급
+                role = ''
+            if role not in allowed:
+                logger.warning(f"Unauthorized '{handler.__name__}' event from role '{role}' (SID {sid})")
+                message = 'Unauthorized event' if role else 'Role not registered'
+                await sio.emit('error', {'message': message}, to=sid)
+                return
+            return await handler(sid, data, role)
+        return wrapper
+    return decorator
+
+def accepts_image(payload_type, max_size):
+    """
+    Rejects the event up front unless data is exactly payload_type and at most
+    max_size long. Applied outside requires_role, so bad payloads are dropped
+    before the role lookup.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(sid, data):
+            if type(data) is not payload_type or len(data) > max_size:
+                logger.error(f"Invalid '{handler.__name__}' payload from SID {sid}")
+                await sio.emit('error', {'message': 'Invalid image data'}, to=sid)
+                return
+            return await handler(sid, data)
+        return wrapper
+    return decorator
+
 # Socket.IO event handlers
 @sio.event
-def connect(sid, environ):
+async def connect(sid, environ):
     logger.info(f"New connection: SID {sid}")
 
 @sio.event
-def disconnect(sid):
-    hub.unregister_client(sid)
+async def disconnect(sid):
+    role = (await sio.get_session(sid)).get('role')
+    if role:
+        logger.info(f"Client disconnected: Role '{role}', SID {sid}")
+    hub.discard_pending_input(sid)
     logger.info(f"Disconnected: SID {sid}")
 
 @sio.event
-def register(sid, data):
-    role = data.get('role')
-    if role not in [ClientRole.MONITOR, ClientRole.LAPA]:
-        logger.warning(f"Invalid role registration attempt: '{role}' by SID {sid}")
-        sio.emit('error', {'message': 'Invalid role'}, to=sid)
+async def register(sid, data):
+    requested_role = data.get('role')
+    role = REGISTRABLE_ROLES.get(requested_role) if isinstance(requested_role, str) else None
+    if role is None:
+        logger.warning(f"Invalid role registration attempt: '{requested_role}' by SID {sid}")
+        await sio.emit('error', {'message': 'Invalid role'}, to=sid)
         return
 
-    hub.register_client(role, sid, sio)
-    sio.emit('registered', {'role': role}, to=sid)
+    async with sio.session(sid) as session:
+        old_role = session.get('role')
+        session['role'] = role
+    if old_role:
+        await sio.leave_room(sid, old_role)
+    # 같은 역할의 클라이언트는 역할 이름의 room으로 묶어서 한 번에 전송 (여러 AI/Monitor 허용)
+    await sio.enter_room(sid, role)
+    await sio.emit('registered', {'role': role}, to=sid)
     logger.info(f"Client registered with role '{role}': SID {sid}")
 
 # 새로운 "image" 이벤트 핸들러 추가
 @sio.event
-def image(sid, data):
-    logger.info(f"Received 'image' event from SID {sid}")
+@accepts_image(bytes, MAX_IMAGE_BYTES)
+@requires_role(_MONITOR_ALLOWED)
+async def image(sid, data, role):
+    logger.debug("Received 'image' event from SID %s", sid)
 
-    # 역할 확인
-    sender_role = None
-    with hub.lock:
-        for role, client_sid in hub.clients.items():
-            if client_sid == sid:
-                sender_role = role
-                break
-
-    if not sender_role:
-        logger.warning(f"'image' event from unregistered client: SID {sid}")
-        sio.emit('error', {'message': 'Role not registered'}, to=sid)
-        return
-
-    if sender_role != ClientRole.MONITOR:
-        logger.warning(f"Unauthorized 'image' event from role '{sender_role}' (SID {sid})")
-        sio.emit('error', {'message': 'Unauthorized event'}, to=sid)
-        return
-
-    image_str = data  # 클라이언트에서 단순히 base64 문자열을 전송
-    if not isinstance(image_str, str):
-        logger.error("Invalid image data format.")
-        sio.emit('error', {'message': 'Invalid image data'}, to=sid)
-        return
+    image_bytes = data  # 클라이언트에서 JPEG 바이너리를 그대로 전송 (base64 인코딩 없음)
 
-    hub.set_input_image_data(image_str)
+    filter_number, people_count = hub.snapshot()
 
     # 현재 filter_number 로그
-    logger.info(f"Current filter_number before sending to AI: {hub.filter_number}")
-
-    input_msg = InputMessage(
-        image=hub.input_image_data,
-        filter_number=hub.filter_number,
-        people_count=hub.people_count
-    )
+    logger.debug("Current filter_number before sending to AI: %s", filter_number)
 
+    input_msg: InputMessage = {
+        'image': image_bytes,
+        'filter_number': filter_number,
+        'people_count': people_count
+    }
 
-    image_ai = main.input(input_msg.__dict__, False)
+    if hub.ai_in_flight >= MAX_AI_IN_FLIGHT:
+        # 이전 프레임이 처리 중이면 대기 슬롯을 최신 프레임으로 덮어씀 (오래된 프레임은 버림)
+        hub.pending_inputs[sid] = input_msg
+        return
 
-    output(image_ai)
+    await process_input(sid, input_msg)
     '''
     ai_sid = hub.get_client_sid(ClientRole.AI)
     if ai_sid:
-        sio.emit('input', input_msg.__dict__, to=ai_sid)
-        logger.info("Sent 'input' event to AI client.")
+        sio.emit('input', input_msg, to=ai_sid)
+        logger.debug("Sent 'input' event to AI client.")
     else:
         logger.warning("AI client is not connected.")
     '''
+
+async def run_pipeline(input_msg: InputMessage, save: bool):
+    # main.input은 CPU 바운드 동기 함수이므로 이벤트 루프를 막지 않도록 스레드 풀에서 실행
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(main.executor, main.input, input_msg, save)
+
+async def process_input(sid: str, input_msg: InputMessage):
+    """
+    Runs an 'image' frame through the AI pipeline and sends the result back to
+    the Monitor that sent it. While it runs, newer frames only replace their
+    sender's slot in hub.pending_inputs; as soon as it finishes, the next
+    pending frame (if any) is processed. At most MAX_AI_IN_FLIGHT frames are
+    ever being processed and each Monitor has at most one frame waiting.
+    """
+    hub.ai_in_flight += 1
+    try:
+        pending = (sid, input_msg)
+        while pending:
+            sid, input_msg = pending
+            try:
+                await output(sid, await run_pipeline(input_msg, False))
+            except Exception as e:
+                logger.error(f"Error while processing input frame: {e}")
+            pending = hub.take_pending_input()
+    finally:
+        hub.ai_in_flight -= 1
+
 # 새로운 "output" 이벤트 핸들러 추가
 
-def output(data):
-    sid = 'ai'
-    image_str = data  # 클라이언트에서 단순히 base64 문자열을 전송
-    logger.info(image_str)
-    if not isinstance(image_str, str):
+async def output(sid, data):
+    image_bytes = data  # AI 파이프라인이 반환한 JPEG 바이너리
+    if not isinstance(image_bytes, bytes):
+        # 파이프라인은 서버 내부에서 실행되므로 에러를 돌려줄 클라이언트가 없음 (로그만 남김)
         logger.error("Invalid output image data format.")
-        sio.emit('error', {'message': 'Invalid output data'}, to=sid)
         return
 
-    hub.set_output_image_data(image_str)
-    monitor_sid = hub.get_client_sid(ClientRole.MONITOR)
-    if monitor_sid:
-        output_msg = OutputMessage(image=image_str)
-        sio.emit('image', output_msg.__dict__, to=monitor_sid)
-        logger.info("Sent 'image' event to Monitor client.")
-    else:
-        logger.warning("Monitor client is not connected.")
+    output_msg: OutputMessage = {'image': image_bytes}
+    await sio.emit('image', output_msg, to=sid)
+    logger.debug("Sent 'image' event to Monitor SID %s", sid)
 
 # 새로운 "filter" 이벤트 핸들러 수정 (ClientRole.LAPA 추가)
 @sio.event
-def filter(sid, data):
+@requires_role(_CONTROL_ALLOWED)
+async def filter(sid, data, role):
     logger.info(f"Received 'filter' event from SID {sid}: {data}")
 
-    # 역할 확인
-    sender_role = None
-    with hub.lock:
-        for role, client_sid in hub.clients.items():
-            if client_sid == sid:
-                sender_role = role
-                break
-
-    if sender_role not in [ClientRole.MONITOR, 'admin', ClientRole.LAPA]:
-        logger.warning(f"Unauthorized attempt to set filter_number by role '{sender_role}' (SID {sid})")
-        sio.emit('error', {'message': 'Unauthorized to set filter_number'}, to=sid)
-        return
-
     # 데이터 검증
     if not isinstance(data, int):
         logger.error("Invalid filter_number format. Must be an integer.")
-        sio.emit('error', {'message': 'Invalid filter_number format. Must be an integer.'}, to=sid)
+        await sio.emit('error', {'message': 'Invalid filter_number format. Must be an integer.'}, to=sid)
         return
 
     filter_number = data  # 정수형 데이터 직접 할당
@@ -243,31 +281,19 @@ def filter(sid, data):
         logger.warning("AI client is not connected. Cannot send 'filter_updated' event.")
     '''
     # 필터 번호가 성공적으로 업데이트되었음을 클라이언트에 알림
-    sio.emit('filter_number_set', {'filter_number': filter_number}, to=sid)
+    await sio.emit('filter_number_set', {'filter_number': filter_number}, to=sid)
     logger.info(f"Filter number set to {filter_number} by SID {sid}")
 
 # 새로운 "people" 이벤트 핸들러 추가
 @sio.event
-def people(sid, data):
+@requires_role(_PEOPLE_ALLOWED)
+async def people(sid, data, role):
     logger.info(f"Received 'people' event from SID {sid}: {data}")
 
-    # 역할 확인
-    sender_role = None
-    with hub.lock:
-        for role, client_sid in hub.clients.items():
-            if client_sid == sid:
-                sender_role = role
-                break
-
-    if sender_role != ClientRole.LAPA:
-        logger.warning(f"Unauthorized attempt to set people_count by role '{sender_role}' (SID {sid})")
-        sio.emit('error', {'message': 'Unauthorized to set people_count'}, to=sid)
-        return
-
     # 데이터 검증
     if not isinstance(data, int) or data < 1:
         logger.error("Invalid people_count format. Must be a positive integer.")
-        sio.emit('error', {'message': 'Invalid people_count format. Must be a positive integer.'}, to=sid)
+        await sio.emit('error', {'message': 'Invalid people_count format. Must be a positive integer.'}, to=sid)
         return
 
     people_count = data  # 정수형 데이터 직접 할당
@@ -284,36 +310,23 @@ def people(sid, data):
         logger.warning("AI client is not connected. Cannot send 'people_updated' event.")
     '''
     # 인원 수가 성공적으로 업데이트되었음을 클라이언트에 알림
-    sio.emit('people_count_set', {'people_count': people_count}, to=sid)
+    await sio.emit('people_count_set', {'people_count': people_count}, to=sid)
     logger.info(f"People count set to {people_count} by SID {sid}")
 
 # 새로운 "trigger_end" 이벤트 핸들러 추가
 @sio.event
-def trigger_end(sid, data):
+@requires_role(_CONTROL_ALLOWED)
+async def trigger_end(sid, data, role):
     """
     This event can be emitted by a client (e.g., Monitor) to request the server to send
     the 'end' event to the AI client with three image strings.
     """
     logger.info(f"Received 'trigger_end' event from SID {sid}: {data}")
 
-    # 역할 확인
-    sender_role = None
-    with hub.lock:
-        for role, client_sid in hub.clients.items():
-            if client_sid == sid:
-                sender_role = role
-                break
-
-    # Define which roles are allowed to trigger the 'end' event
-    if sender_role not in [ClientRole.MONITOR, 'admin', ClientRole.LAPA]:
-        logger.warning(f"Unauthorized attempt to trigger 'end' by role '{sender_role}' (SID {sid})")
-        sio.emit('error', {'message': 'Unauthorized to trigger end'}, to=sid)
-        return
-
     # 데이터 검증
     if not isinstance(data, dict):
         logger.error("Invalid data format for 'trigger_end'. Expected a dictionary.")
-        sio.emit('error', {'message': 'Invalid data format. Expected a dictionary with end images.'}, to=sid)
+        await sio.emit('error', {'message': 'Invalid data format. Expected a dictionary with end images.'}, to=sid)
         return
 
     end_frame = data.get('end_frame')
@@ -322,29 +335,24 @@ def trigger_end(sid, data):
 
     if not all(isinstance(img, str) for img in [end_frame, end_img1, end_img2]):
         logger.error("Invalid end image data format. All end images must be base64 strings.")
-        sio.emit('error', {'message': 'Invalid end image data format. All end images must be base64 strings.'}, to=sid)
+        await sio.emit('error', {'message': 'Invalid end image data format. All end images must be base64 strings.'}, to=sid)
         return
 
     # Optionally, store the end images
     hub.set_end_images(end_frame, end_img1, end_img2)
 
-    # Create EndMessage
-    end_msg = EndMessage(
-        end_frame=end_frame,
-        end_img1=end_img1,
-        end_img2=end_img2
-    )
-    end(end_msg.__dict__)
-    # Send 'end' event to AI client
-    ai_sid = hub.get_client_sid(ClientRole.AI)
-    if ai_sid:
-        sio.emit('end', end_msg.__dict__, to=ai_sid)
-        logger.info(f"Sent 'end' event to AI client (SID {ai_sid}) with end images.")
-    else:
-        logger.warning("AI client is not connected. Cannot send 'end' event.")
+    # Create EndMessage payload
+    end_msg: EndMessage = {
+        'end_frame': end_frame,
+        'end_img1': end_img1,
+        'end_img2': end_img2
+    }
+    # Send 'end' event to AI clients
+    await sio.emit('end', end_msg, room=ClientRole.AI)
+    logger.info("Sent 'end' event to AI clients with end images.")
 
     # Acknowledge the trigger to the sender
-    sio.emit('end_triggered', {'message': 'End event triggered successfully.'}, to=sid)
+    await sio.emit('end_triggered', {'message': 'End event triggered successfully.'}, to=sid)
     logger.info(f"'end' event triggered by SID {sid}")
 '''
 def save_base64_image(image_base64, output_dir, output_file):
@@ -370,43 +378,21 @@ def save_base64_image(image_base64, output_dir, output_file):
 '''
 
 @sio.event
-def result(sid, data):
+@accepts_image(str, MAX_IMAGE_B64_BYTES)
+@requires_role(_MONITOR_ALLOWED)
+async def result(sid, data, role):
     logger.info(f"Received 'result' event from SID {sid}")
 
-    # 역할 확인
-    sender_role = None
-    with hub.lock:
-        for role, client_sid in hub.clients.items():
-            if client_sid == sid:
-                sender_role = role
-                break
-
-    if not sender_role:
-        logger.warning(f"'result' event from unregistered client: SID {sid}")
-        sio.emit('error', {'message': 'Role not registered'}, to=sid)
-        return
-
-    if sender_role != ClientRole.MONITOR:
-        logger.warning(f"Unauthorized 'result' event from role '{sender_role}' (SID {sid})")
-        sio.emit('error', {'message': 'Unauthorized event'}, to=sid)
-        return
-
     image_str = data  # 클라이언트에서 단순히 base64 문자열을 전송
-    if not isinstance(image_str, str):
-        logger.error("Invalid image data format.")
-        sio.emit('error', {'message': 'Invalid image data'}, to=sid)
-        return
 
-    hub.set_input_image_data(image_str)
+    filter_number, people_count = hub.snapshot()
+    input_msg: InputMessage = {
+        'image': image_str,
+        'filter_number': filter_number,
+        'people_count': people_count
+    }
 
-    input_msg = InputMessage(
-        image=hub.input_image_data,
-        filter_number=hub.filter_number,
-        people_count=hub.people_count
-    )
-
-
-    main.input(input_msg.__dict__, True)
+    await run_pipeline(input_msg, True)
 
     '''
     output_directory = r"C:\/Users\kyle0\Desktop\/ai-together-backend_new\/res_img"
@@ -468,105 +454,90 @@ def end(sid, data):
         logger.warning("Monitor client is not connected. Cannot send 'end_composited' event.")
 '''
 
-def end(sid, data):
+async def end(sid, data):
     """
-    This handler processes the 'end' event received from the AI client.
+    This handler processes the composited result of a 'trigger_end' request.
     It expects a composited image and forwards it to the Monitor client.
+    Errors are reported back to sid, the client that triggered the end.
     """
-    sid = 'ai'
-    logger.info(f"Received 'end' event from SID {sid}: {data}")
+    logger.info(f"Received 'end' result for SID {sid}")
 
 
     # 데이터 검증
     if not isinstance(data, dict):
         logger.error("Invalid data format for 'end' event. Expected a dictionary.")
-        sio.emit('error', {'message': 'Invalid data format for end event.'}, to=sid)
+        await sio.emit('error', {'message': 'Invalid data format for end event.'}, to=sid)
         return
 
     composited_image = data.get('composited_image')
     if not isinstance(composited_image, str):
         logger.error("Invalid composited image format. Must be a base64 string.")
-        sio.emit('error', {'message': 'Invalid composited image format.'}, to=sid)
+        await sio.emit('error', {'message': 'Invalid composited image format.'}, to=sid)
         return
 
     # Optionally, store the composited image
     # hub.set_composited_image(composited_image)
 
-    # Forward the composited image to the Monitor client
-    monitor_sid = hub.get_client_sid(ClientRole.MONITOR)
-    if monitor_sid:
-        composited_msg = {'composited_image': composited_image}
-        sio.emit('end_composited', composited_msg, to=monitor_sid)
-        logger.info("Sent 'end_composited' event to Monitor client.")
-    else:
-        logger.warning("Monitor client is not connected. Cannot send 'end_composited' event.")
-
-# Serve static files from the "public" directory
-@app.route('/')
-def index():
-    return send_from_directory(app.static_folder, 'index.html')
-
-@app.route('/<path:path>')
-def static_files(path):
-    return send_from_directory(app.static_folder, path)
-
+    # Forward the composited image to the Monitor clients
+    composited_msg: CompositedEndMessage = {'composited_image': composited_image}
+    await sio.emit('end_composited', composited_msg, room=ClientRole.MONITOR)
+    logger.info("Sent 'end_composited' event to Monitor clients.")
 
-def run_server():
-    # Run the server with eventlet
-    eventlet.wsgi.server(eventlet.listen(('0.0.0.0', 8888)), app)
-
-def shutdown_server(signum, frame):
-    logger.info("Shutting down server...")
-    sys.exit(0)
-    import os
-    import base64
-    from flask import Flask, request, jsonify
-    from PIL import Image
-    from io import BytesIO
+# Serve static files from the "public" directory (Socket.IO 이외의 요청은 StaticFiles가 처리).
+# StaticFiles는 파일을 스레드 풀에서 읽으므로 이벤트 루프를 막지 않음.
+# nginx 등 리버스 프록시가 정적 파일을 직접 서빙하는 배포에서는 STATIC_DIR=''로 마운트를 끔
+STATIC_DIR = os.environ.get('STATIC_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public'))
+static_files = StaticFiles(directory=STATIC_DIR, html=True) if os.path.isdir(STATIC_DIR) else None  # html=True: '/' 요청 시 index.html 반환
+app = socketio.ASGIApp(sio, static_files)
 
-    app = Flask(__name__)
 
-    # 이미지 업로드 경로 설정
-    UPLOAD_FOLDER = 'uploads'
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+HOST = '0.0.0.0'
+PORT = 8888
 
-    @app.route('/upload', methods=['POST'])
-    def upload_image():
-        try:
-            # Base64 문자열 받기
-            data = request.json.get('image_data')
-            if not data:
-                return jsonify({"error": "No image data provided"}), 400
+# 리스닝 소켓에 적용할 옵션 (level, option, value). accept된 클라이언트 소켓은 이 설정을 상속함
+SOCK_OPTS = []
 
-            # Base64로 인코딩된 데이터를 디코딩하여 이미지로 변환
-            img_data = base64.b64decode(data.split(',')[1])  # data URI 형식 처리 (prefix 제거)
-            image = Image.open(BytesIO(img_data))
+# 송수신 버퍼는 환경 변수 SO_SNDBUF / SO_RCVBUF(바이트)가 설정된 경우에만 지정.
+# 미설정 시 커널 TCP autotune을 그대로 사용 (값을 고정하면 autotune이 꺼짐)
+for _env, _opt in (('SO_SNDBUF', socket.SO_SNDBUF), ('SO_RCVBUF', socket.SO_RCVBUF)):
+    if os.environ.get(_env):
+        SOCK_OPTS.append((socket.SOL_SOCKET, _opt, int(os.environ[_env])))
 
-            # 이미지 파일로 저장
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'uploaded_image.png')
-            image.save(file_path)
+# 수락된 클라이언트 소켓에 적용할 옵션. asyncio/uvloop 트랜스포트는 생성 시 TCP_NODELAY를 켜므로
+# TCP_NODELAY=0으로 다시 꺼서 Nagle을 유지 (연달아 나가는 작은 Socket.IO 프레임을 하나의 세그먼트로 묶음)
+CLIENT_SOCK_OPTS = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)]
 
-            # 이미지가 업로드된 URL 반환 (서버에서 이미지 제공)
-            image_url = f"http://localhost:5000/{file_path}"
-            return jsonify({"image_url": image_url}), 200
+def _apply_sock_opts(sock, opts):
+    for level, opt, value in opts:
+        sock.setsockopt(level, opt, value)
 
-        except Exception as e:
-            return jsonify({"error": str(e)}), 500
-
-    @app.route('/uploads/<filename>')
-    def uploaded_file(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+class TunedHTTPProtocol(AutoHTTPProtocol):
+    """
+    uvicorn's default HTTP protocol, but CLIENT_SOCK_OPTS are applied to every
+    accepted client socket first. A WebSocket upgrade keeps the same socket,
+    so the options carry over to the WebSocket connection.
+    """
+    def connection_made(self, transport):
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            _apply_sock_opts(sock, CLIENT_SOCK_OPTS)
+        super().connection_made(transport)
+
+def create_listen_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # 수신 윈도우 크기가 협상되기 전에 적용되도록 bind/listen 전에 설정
+    _apply_sock_opts(sock, SOCK_OPTS)
+    sock.bind((host, port))
+    return sock
 
-    if __name__ == '__main__':
-        app.run(debug=True)
+def run_server():
+    # Run the server with uvicorn (uvicorn[standard]의 uvloop/httptools/websockets를 자동 선택, SIGINT/SIGTERM 시 graceful shutdown)
+    server = uvicorn.Server(uvicorn.Config(app, host=HOST, port=PORT, loop='auto', http=TunedHTTPProtocol))
+    server.run(sockets=[create_listen_socket(HOST, PORT)])
 
 
 if __name__ == '__main__':
-    # Handle graceful shutdown
-    signal.signal(signal.SIGINT, shutdown_server)
-    signal.signal(signal.SIGTERM, shutdown_server)
-
-    logger.info("Starting server on 0.0.0.0:8888")
+    logger.info(f"Starting server on {HOST}:{PORT}")
 
     run_server()
@@ -0,0 +1,19 @@
+import json
+
+import orjson
+
+# socketio.Server(json=...)에 넘기는 JSON 모듈 대체.
+# socketio/engineio는 dumps 결과로 str을 기대하므로 orjson의 bytes를 디코딩해서 반환
+
+
+def dumps(obj, *args, **kwargs):
+    # separators 등 stdlib json 인자는 무시 (orjson은 항상 공백 없는 compact 출력)
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    except TypeError:
+        # 64비트를 넘는 정수 등 orjson이 직렬화하지 못하는 값은 stdlib json으로 처리
+        return json.dumps(obj, *args, **kwargs)
+
+
+def loads(s, *args, **kwargs):
+    return orjson.loads(s)
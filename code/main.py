@@ -23,7 +23,8 @@ face_mesh = mp_face_mesh.FaceMesh(
 )
 
 # 쓰레드 풀
-executor = ThreadPoolExecutor(max_workers=4)  # 이미지 처리를 위한 스레드 풀
+# face_mesh는 스레드 안전하지 않으므로 워커 하나로 프레임을 순서대로 처리
+executor = ThreadPoolExecutor(max_workers=1)  # 이미지 처리를 위한 스레드 풀
 
 
 # 얼굴 각도 계산 함수
@@ -201,23 +202,23 @@ def convert_image_to_qr(image_path, output_path):
 
 def input(data, temp):
     try:
-        img_data = base64.b64decode(data['image'] + '==')
+        img_data = data['image']
+        if isinstance(img_data, str):  # 'result' 이벤트는 여전히 base64 문자열을 전송
+            img_data = base64.b64decode(img_data + '==')
         np_arr = np.frombuffer(img_data, np.uint8)
         image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
         filter_number = data.get('filter_number', 0)
-        app.logger.info(f"Received filter number: {filter_number}")
+        app.logger.debug("Received filter number: %s", filter_number)
 
         FILTER_DIRECTORY = r'C:\Users\kyle0\Desktop\trick-or-picture-main\trick-or-picture-main\img'  # 필터 이미지 디렉토리
 
         filter_image = os.path.join(FILTER_DIRECTORY, f"{filter_number}.png")  # 경로 안전하게 결합
-        print(f"Trying to find filter image at: {filter_image}")
+        app.logger.debug("Trying to find filter image at: %s", filter_image)
 
         if os.path.isfile(filter_image):
-            print("OK")
             filter_image_path = filter_image
         else:
-            print(f"File does not exist: {filter_image}")
-            app.logger.error("Failed to decode image")
+            app.logger.error("Filter image not found: %s", filter_image)
 
         # BGR에서 RGB로 변환
         image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
@@ -235,13 +236,11 @@ def input(data, temp):
             #convert_image_to_qr("../res_img/res.png", "../qrcode/qr.png")
 
 
-        # 필터링된 이미지를 Base64로 인코딩
+        # 필터링된 이미지를 JPEG 바이너리로 인코딩 (Socket.IO 바이너리 첨부로 전송)
         _, buffer = cv2.imencode('.jpg', processed_image)
-        jpg_as_text = base64.b64encode(buffer).decode('utf-8')
 
-        app.logger.info("Processed image sent successfully.")
-        #print(jpg_as_text)
-        return jpg_as_text
+        app.logger.debug("Processed image sent successfully.")
+        return buffer.tobytes()
 
 
     except Exception as e: